@@ -1,10 +1,13 @@
+import os
+from typing import Optional
+
 import pandas as pd
 import wandb
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset
 
 from datasets.src.zenke_2a.constants import TRAIN_DATA_PATH
-from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset
+from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset, SpikeEncodedDataset
 from model.src import logging_util
 from model.src.settings import Settings
 from model.src.network import Net
@@ -12,10 +15,36 @@ from model.src.network import Net
 NUM_STEPS = 7000
 BATCH_SIZE = 10
 ENCODE_SPIKE_TRAINS = False
+NUM_WORKERS = 4
+PREFETCH_FACTOR = 2
+# TODO: remove when network is stabilized
+MAX_BATCHES = 1
+
+
+def configure_torch() -> None:
+    # anomaly detection slows down every autograd op, so only enable it on request
+    if os.getenv("DEBUG_ANOMALY"):
+        torch.autograd.set_detect_anomaly(True)
+
+    # allow TF32 / reduced precision internal math for float32 matmuls
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
+
+def build_train_loader(dataset: Dataset, batch_size: int, device: torch.device, encode_spike_trains: bool,
+                       max_batches: Optional[int]) -> DataLoader:
+    train_dataset = SpikeEncodedDataset(dataset) if encode_spike_trains else dataset
+    # a single batch is not worth starting and prefetching from worker processes
+    num_workers = 0 if max_batches == 1 else NUM_WORKERS
+    return DataLoader(
+        train_dataset, batch_size=batch_size, shuffle=False,
+        num_workers=num_workers, prefetch_factor=PREFETCH_FACTOR if num_workers > 0 else None,
+        persistent_workers=num_workers > 0, pin_memory=device.type == "cuda")
 
 
 if __name__ == "__main__":
-    torch.autograd.set_detect_anomaly(True)
+    configure_torch()
     torch.manual_seed(1234)
     torch.set_printoptions(precision=10, sci_mode=False)
 
@@ -28,7 +57,8 @@ if __name__ == "__main__":
         learning_rate=0.01,
         epochs=10,
         encode_spike_trains=ENCODE_SPIKE_TRAINS,
-        device=torch.device("cpu")
+        device=torch.device("cpu"),
+        max_batches=MAX_BATCHES
     )
 
     wandb.init(
@@ -44,15 +74,16 @@ if __name__ == "__main__":
     )
 
     try:
-        train_dataframe = pd.read_csv(TRAIN_DATA_PATH)
+        train_dataframe = pd.read_csv(TRAIN_DATA_PATH, engine="pyarrow")
     except FileNotFoundError:
         train_dataframe = None
 
     train_sequential_dataset = SequentialDataset(
         DatasetType.TRAIN,
         train_dataframe, num_timesteps=NUM_STEPS, planned_batch_size=settings.batch_size)
-    train_data_loader = DataLoader(
-        train_sequential_dataset, batch_size=settings.batch_size, shuffle=False)
+    train_data_loader = build_train_loader(
+        train_sequential_dataset, settings.batch_size, settings.device, settings.encode_spike_trains,
+        settings.max_batches)
 
     net = Net(settings).to(device=settings.device)
     net.process_data_online(train_data_loader)
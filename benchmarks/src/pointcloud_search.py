@@ -9,7 +9,7 @@ import torch
 from torch.utils.data import DataLoader
 
 from model.src import logging_util
-from benchmarks.src.pointcloud import ENCODE_SPIKE_TRAINS
+from benchmarks.src.pointcloud import ENCODE_SPIKE_TRAINS, MAX_BATCHES, build_train_loader, configure_torch
 from datasets.src.zenke_2a.constants import TRAIN_DATA_PATH
 from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset
 from model.src.layer import Layer
@@ -19,6 +19,7 @@ from model.src.visualizer import NetworkVisualizer
 
 THIS_TEST_NUM_SAMPLES = 5
 THIS_TEST_NUM_DATAPOINTS = 8000
+DEVICE = torch.device("cpu")
 
 
 def objective() -> None:
@@ -74,11 +75,24 @@ def objective() -> None:
         running_log.write(f"{run_settings}")
         running_log.flush()
 
+        # build the training data once and share it across all seeds, only the
+        # network depends on the seed
+        try:
+            train_dataframe = pd.read_csv(TRAIN_DATA_PATH, engine="pyarrow")
+        except FileNotFoundError:
+            train_dataframe = None
+        train_sequential_dataset = SequentialDataset(DatasetType.TRAIN,
+                                                     train_dataframe, num_timesteps=THIS_TEST_NUM_DATAPOINTS,
+                                                     planned_batch_size=THIS_TEST_NUM_SAMPLES)
+        train_data_loader = build_train_loader(
+            train_sequential_dataset, THIS_TEST_NUM_SAMPLES, DEVICE, ENCODE_SPIKE_TRAINS, MAX_BATCHES)
+
         pass_count = 0
         total_count = 0
         for _ in range(10):
             is_pass = bench_specific_seed(
                 running_log,
+                train_data_loader,
                 layer_sizes, learning_rate, dt, percentage_inhibitory,
                 exc_to_inhib_conn_c, exc_to_inhib_conn_sigma_squared, layer_sparsity,
                 decay_beta, threshold_scale, threshold_decay, tau_mean, tau_var, tau_stdp,
@@ -97,6 +111,7 @@ def objective() -> None:
 
 
 def bench_specific_seed(running_log: TextIO,
+                        train_data_loader: DataLoader,
                         layer_sizes: list[int],
                         learning_rate: float,
                         dt: float,
@@ -139,32 +154,23 @@ def bench_specific_seed(running_log: TextIO,
         tau_fall_alpha=tau_fall_alpha,
         tau_rise_epsilon=tau_rise_epsilon,
         tau_fall_epsilon=tau_fall_epsilon,
-        device=torch.device("cpu")
+        device=DEVICE,
+        max_batches=MAX_BATCHES
     )
 
-    try:
-        train_dataframe = pd.read_csv(TRAIN_DATA_PATH)
-    except FileNotFoundError:
-        train_dataframe = None
-    train_sequential_dataset = SequentialDataset(DatasetType.TRAIN,
-                                                 train_dataframe, num_timesteps=THIS_TEST_NUM_DATAPOINTS,
-                                                 planned_batch_size=settings.batch_size)
-    train_data_loader = DataLoader(
-        train_sequential_dataset, batch_size=settings.batch_size, shuffle=False)
-
     net = Net(settings).to(settings.device)
 
     layer: Layer = net.layers[0]
     weights = layer.forward_weights.weight()
-    mask = layer.excitatory_mask_vec
-    mask_expanded = mask.unsqueeze(
-        1).expand(-1, layer.layer_settings.data_size)
-    starting_weights_filtered_and_masked = weights[mask_expanded.bool()]
+    # select the rows of weights onto excitatory neurons once, and flatten
+    # them so that x and y weights come in segments of 2
+    excitatory_rows = layer.excitatory_mask_vec.bool()
+    starting_weights_filtered_and_masked = weights[excitatory_rows].flatten()
 
     net.process_data_online(train_data_loader)
 
     weights = layer.forward_weights.weight()
-    weights_filtered_and_masked = weights[mask_expanded.bool()]
+    weights_filtered_and_masked = weights[excitatory_rows].flatten()
 
     is_pass: bool = weights_filtered_and_masked[0] > 0.3 and (
         weights_filtered_and_masked[1] < 0.05 or
@@ -184,7 +190,7 @@ def bench_specific_seed(running_log: TextIO,
 
 
 if __name__ == "__main__":
-    torch.autograd.set_detect_anomaly(True)
+    configure_torch()
     torch.set_printoptions(precision=10, sci_mode=False)
     logging_util.set_logging()
 
@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
 from datasets.src.zenke_2a.constants import TEST_DATA_PATH, TRAIN_DATA_PATH
 
@@ -30,29 +29,30 @@ def generate_sequential_dataset(
     Returns:
     pd.DataFrame: DataFrame containing the sequential dataset with batch information.
     """
-    data = []  # List to store data before converting to DataFrame
+    # Decide for every datapoint whether to switch clusters, then recover the
+    # cluster trajectory of each sample from the running count of switches
+    switches = np.random.random(
+        (num_samples, num_datapoints)) < cluster_switch_prob
+    start_cluster = np.random.randint(0, num_clusters, size=num_samples)
+    clusters = (start_cluster[:, None] +
+                np.cumsum(switches, axis=1)) % num_clusters
 
-    for sample in tqdm(range(num_samples), desc='Generating samples'):
-        current_cluster = np.random.randint(0, num_clusters)
-        for i in range(num_datapoints):
-            # Decide whether to switch clusters
-            if np.random.rand() < cluster_switch_prob:
-                current_cluster = (current_cluster + 1) % num_clusters
+    # Cluster center along the x-axis
+    center_x = clusters * 2.0
 
-            # Cluster center along the x-axis
-            center_x = current_cluster * 2.0
-
-            # Generate the data point
-            data_point = [sample, np.random.normal(
-                center_x, 0.1), np.random.random()]
-            data.append(data_point)
-
-    # Convert list to DataFrame
-    df = pd.DataFrame(data, columns=['sample', 'x', 'y'])
+    # Generate the data points
+    x = np.random.normal(center_x, 0.1)
+    y = np.random.random((num_samples, num_datapoints))
 
     # Normalize columns independently
-    df[['x', 'y']] = (df[['x', 'y']] - df[['x', 'y']].min()) / \
-        (df[['x', 'y']].max() - df[['x', 'y']].min())
+    x = (x - x.min()) / (x.max() - x.min())
+    y = (y - y.min()) / (y.max() - y.min())
+
+    df = pd.DataFrame({
+        'sample': np.repeat(np.arange(num_samples), num_datapoints),
+        'x': x.ravel(),
+        'y': y.ravel(),
+    })
 
     return df
 
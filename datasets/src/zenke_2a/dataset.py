@@ -2,6 +2,7 @@ from enum import Enum
 import logging
 from typing import List, Union, Optional
 
+import numpy as np
 import torch
 from torch.utils.data import Dataset, DataLoader
 import pandas as pd
@@ -32,10 +33,8 @@ class SequentialDataset(Dataset):
         if dataframe_tmp is not None:
             # check the dims of this dataframe and if the dataframe dims don't
             # match, then regenerate the data
-            samples = dataframe_tmp.groupby('sample')
-            sample_data = samples.get_group(0)
-            sample_data = sample_data[['x', 'y']].to_numpy()
-            sample_tensor = torch.tensor(sample_data, dtype=torch.float)
+            sample_data = dataframe_tmp.loc[dataframe_tmp['sample'] == 0, ['x', 'y']].to_numpy(dtype=np.float32)
+            sample_tensor = torch.from_numpy(sample_data)
 
             # NOTE: single batch verification
             if len(dataframe_tmp) / \
@@ -53,12 +52,24 @@ class SequentialDataset(Dataset):
                 num_samples=planned_batch_size, num_datapoints=num_timesteps)
             path = TRAIN_DATA_PATH if dataset_type == DatasetType.TRAIN else TEST_DATA_PATH
             dataframe_tmp.to_csv(path, index=False)
-            self.dataframe = pd.read_csv(path)
+            self.dataframe = pd.read_csv(path, engine="pyarrow")
             del dataframe_tmp
         else:
             self.dataframe = dataframe_tmp
 
-        self.samples = self.dataframe.groupby('sample')
+        # group the rows of each sample together, keeping their order within
+        # the sample like groupby does, so the whole dataframe can be viewed as
+        # (num_samples, num_datapoints, 2) once up front
+        dataframe_sorted = self.dataframe.sort_values('sample', kind='stable')
+        num_samples = dataframe_sorted['sample'].nunique()
+        num_datapoints = len(dataframe_sorted) // num_samples
+        expected_sample_ids = np.repeat(np.arange(num_samples), num_datapoints)
+        if not np.array_equal(dataframe_sorted['sample'].to_numpy(), expected_sample_ids):
+            raise ValueError(
+                "Every sample must be numbered from 0 and have the same number of rows")
+        data = dataframe_sorted[['x', 'y']].to_numpy(dtype=np.float32)
+        self.data = torch.from_numpy(
+            data.reshape(num_samples, num_datapoints, 2)).contiguous()
         self.num_timesteps = num_timesteps
         return
 
@@ -66,7 +77,7 @@ class SequentialDataset(Dataset):
         """
         Returns the total number of samples in the dataset.
         """
-        return len(self.samples)
+        return self.data.shape[0]
 
     def __getitem__(self,
                     idx: Union[int,
@@ -78,15 +89,41 @@ class SequentialDataset(Dataset):
         if torch.is_tensor(idx):
             idx = idx.tolist()  # type: ignore[union-attr]
 
-        sample_data = self.samples.get_group(idx)
-        sample_data = sample_data[['x', 'y']].to_numpy()
-        sample_tensor = torch.tensor(sample_data, dtype=torch.float)
+        return self.data[idx, 0:self.num_timesteps, :]
 
-        return sample_tensor[0:self.num_timesteps, :]
+
+class SpikeEncodedDataset(Dataset):
+    """
+    A PyTorch Dataset wrapper that encodes the samples of another dataset as
+    spike trains. Encoding here instead of in the training loop lets the
+    DataLoader workers do it in parallel with training.
+    """
+
+    def __init__(self, dataset: Dataset, spike_threshold: float = 0.5) -> None:
+        self.dataset = dataset
+        self.spike_threshold = spike_threshold
+
+    def __len__(self) -> int:
+        """
+        Returns the total number of samples in the wrapped dataset.
+        """
+        return len(self.dataset)  # type: ignore[arg-type]
+
+    def __getitem__(self,
+                    idx: Union[int,
+                               List[int],
+                               torch.Tensor]) -> torch.Tensor:
+        """
+        Retrieves a sample from the wrapped dataset and encodes it as a spike
+        train. Spikes are stored as uint8 to cut host to device traffic, the
+        network casts them to float after the transfer.
+        """
+        sample: torch.Tensor = self.dataset[idx]
+        return (sample > self.spike_threshold).to(torch.uint8)
 
 
 if __name__ == "__main__":
-    dataframe = pd.read_csv(TRAIN_DATA_PATH)
+    dataframe = pd.read_csv(TRAIN_DATA_PATH, engine="pyarrow")
     sequential_dataset = SequentialDataset(
         DatasetType.TRAIN, dataframe, num_timesteps=10)
 
@@ -5,7 +5,7 @@ import matplotlib.pyplot as plt
 from datasets.src.zenke_2a.constants import TRAIN_DATA_PATH
 
 if __name__ == "__main__":
-    data = pd.read_csv(TRAIN_DATA_PATH)
+    data = pd.read_csv(TRAIN_DATA_PATH, engine="pyarrow")
 
     # Create a scatter plot
     plt.figure(figsize=(10, 6))
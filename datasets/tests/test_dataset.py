@@ -3,7 +3,7 @@ import torch
 import pandas as pd
 
 from datasets.src.zenke_2a.constants import TRAIN_DATA_PATH
-from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset
+from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset, SpikeEncodedDataset
 from datasets.src.zenke_2a import datagen
 
 # Constants for testing
@@ -34,3 +34,27 @@ def test_sequential_dataset_getitem(test_data: pd.DataFrame) -> None:
         sample), "Data in sample should be a torch tensor"
     assert sample.shape[0] > 0, "Sample should have at least 1 row"
     assert sample.shape[1] == 2, "Sample should have 2 columns"
+
+
+def test_spike_encoded_dataset(test_data: pd.DataFrame) -> None:
+    """Test that the SpikeEncodedDataset thresholds the wrapped samples."""
+    sequential_dataset = SequentialDataset(DatasetType.TRAIN, test_data)
+    dataset = SpikeEncodedDataset(sequential_dataset, spike_threshold=0.3)
+    assert len(dataset) == len(sequential_dataset), "Length should match the wrapped dataset"
+
+    sample = dataset[0]
+    assert sample.dtype == torch.uint8, "Spikes should be stored as uint8"
+    assert sample.shape == sequential_dataset[0].shape, "Encoding should keep the sample shape"
+    assert set(sample.unique().tolist()) <= {0, 1}, "Spikes should be 0 or 1"
+    assert torch.equal(sample.bool(), sequential_dataset[0] > 0.3), "Spikes should be thresholded at spike_threshold"
+
+
+def test_sequential_dataset_interleaved_rows(test_data: pd.DataFrame) -> None:
+    """Test that samples whose rows are interleaved are grouped back together."""
+    row_in_sample = test_data.groupby('sample').cumcount()
+    interleaved = test_data.assign(row=row_in_sample).sort_values('row', kind='stable').drop(columns='row')
+
+    dataset = SequentialDataset(DatasetType.TRAIN, test_data)
+    interleaved_dataset = SequentialDataset(DatasetType.TRAIN, interleaved)
+
+    assert torch.equal(interleaved_dataset.data, dataset.data), "Interleaved rows should give the same samples"
@@ -1,7 +1,6 @@
 import logging
-from typing import Optional, Self
+from typing import Optional, Self, Tuple
 
-import numpy as np
 import torch
 from torch import nn
 import wandb
@@ -10,7 +9,8 @@ from model.src.constants import DELTA, \
     KAPPA, LAMBDA_HEBBIAN, THETA_REST, XI, ZENKE_BETA
 from model.src.logging_util import ExcitatorySynapticWeightEquation
 from model.src.settings import LayerSettings
-from model.src.util import ExcitatorySynapseFilterGroup, InhibitoryPlasticityTrace, MovingAverageLIF, SynapticUpdateType
+from model.src.util import DoubleExponentialFilter, ExcitatorySynapseFilterGroup, InhibitoryPlasticityTrace, \
+    MovingAverageLIF, SynapticUpdateType
 
 
 def inhibitory_mask_vec(length: int, percentage_ones: int) -> torch.Tensor:
@@ -42,15 +42,9 @@ class SparseLinear(nn.Module):
         """
         Create a sparsity mask for the weights of the linear layer.
         """
-        # create sparse mask
-        mask = np.random.rand(
-            self.out_features,
-            self.in_features) > self.sparsity
-        mask = torch.tensor(
-            mask,
-            dtype=torch.float32,
-            requires_grad=False).to(
-            self.layer_settings.device)
+        # create sparse mask, drawn directly on the device with the torch RNG
+        mask = (torch.rand(self.out_features, self.in_features,
+                           device=self.layer_settings.device) > self.sparsity).float()
 
         if self.layer_settings.layer_id == 0 and self.synaptic_update_type == SynapticUpdateType.FORWARD:
             self.mask = mask
@@ -157,6 +151,10 @@ class Layer(nn.Module):
             self.inhibitory_mask_vec +
             self.excitatory_mask_vec == 1)
 
+        # +1 for excitatory neurons and -1 for inhibitory neurons
+        self.register_buffer("synapse_sign_vec", self.excitatory_mask_vec - self.inhibitory_mask_vec)
+        self.synapse_sign_vec: torch.Tensor = self.synapse_sign_vec
+
         self.lif = MovingAverageLIF(layer_settings)
 
         self.prev_layer: Optional[Layer] = None
@@ -169,6 +167,11 @@ class Layer(nn.Module):
         self.backward_filter_group = ExcitatorySynapseFilterGroup(
             self.layer_settings)
 
+        # the second term of the excitatory rule only depends on the neurons of
+        # this layer, so one filter is shared by all projections into it
+        self.second_term_alpha_filter = DoubleExponentialFilter(
+            layer_settings.tau_rise_alpha, layer_settings.tau_fall_alpha, device=layer_settings.device)
+
         trace_shape = (layer_settings.batch_size, layer_settings.size)
         self.inhibitory_trace = InhibitoryPlasticityTrace(
             device=self.layer_settings.device, trace_shape=trace_shape, tau_stdp=layer_settings.tau_stdp)
@@ -212,6 +215,8 @@ class Layer(nn.Module):
         return self
 
     def retreive_activations(self) -> torch.Tensor:
+        # NOTE: This is a view into the spike ring buffer, which will be
+        # overwritten later. Callers that keep it must copy it.
         return self.lif.spike_moving_average.spike_rec[-1]
 
     def set_next_layer(self, next_layer: Self) -> None:
@@ -233,25 +238,19 @@ class Layer(nn.Module):
 
     def forward(self, data: Optional[torch.Tensor] = None) -> torch.Tensor:
         with torch.no_grad():
-            excitatory_recurrent_mask = self.excitatory_mask_vec
+            # NOTE: Excitatory presynaptic neurons add current and inhibitory
+            # presynaptic neurons subtract it. Scaling the weight columns by the
+            # sign of the presynaptic neuron yields the current of each
+            # projection in a single matmul.
 
             # recurrent
-            inhib_recurrent_masked = self.inhibitory_mask_vec.unsqueeze(0).expand(
-                self.layer_settings.size, -1) * self.recurrent_weights.weight()
-            excitatory_recurrent_masked = excitatory_recurrent_mask.unsqueeze(0).expand(
-                self.layer_settings.size, -1) * self.recurrent_weights.weight()
-
-            assert inhib_recurrent_masked.shape == self.recurrent_weights.weight().shape
-            assert excitatory_recurrent_masked.shape == self.recurrent_weights.weight().shape
+            recurrent_weights = self.synapse_sign_vec * self.recurrent_weights.weight()
+            assert recurrent_weights.shape == (
+                self.layer_settings.size, self.layer_settings.size)
 
             recurrent_input = self.lif.spike_moving_average.spike_rec[-1]
-            recurrent_current_inhibitory = torch.nn.functional.linear(
-                recurrent_input, inhib_recurrent_masked)
-            recurrent_current_excitatory = torch.nn.functional.linear(
-                recurrent_input, excitatory_recurrent_masked)
-            recurrent_contribution = recurrent_current_excitatory - recurrent_current_inhibitory
-
-            total_current = recurrent_contribution.detach().clone()
+            total_current = torch.nn.functional.linear(
+                recurrent_input, recurrent_weights)
             assert total_current.shape == (
                 self.layer_settings.batch_size,
                 self.layer_settings.size)
@@ -262,44 +261,25 @@ class Layer(nn.Module):
             else:
                 assert self.prev_layer is not None
 
-                excitatory_forward_mask = self.prev_layer.excitatory_mask_vec
-
-                inhib_forward_masked = self.prev_layer.inhibitory_mask_vec.unsqueeze(
-                    0).expand(self.layer_settings.size, -1) * self.forward_weights.weight()
-                excitatory_forward_masked = excitatory_forward_mask.unsqueeze(
-                    0).expand(self.layer_settings.size, -1) * self.forward_weights.weight()
-
-                assert inhib_forward_masked.shape == self.forward_weights.weight().shape
-                assert excitatory_forward_masked.shape == self.forward_weights.weight().shape
+                forward_weights = self.prev_layer.synapse_sign_vec * self.forward_weights.weight()
+                assert forward_weights.shape == (
+                    self.layer_settings.size, self.layer_settings.prev_size)
 
                 forward_input = self.prev_layer.lif.spike_moving_average.spike_rec[-1]
-                forward_current_inhibitory = torch.nn.functional.linear(
-                    forward_input, inhib_forward_masked)
-                forward_current_excitatory = torch.nn.functional.linear(
-                    forward_input, excitatory_forward_masked)
-                forward_contribution = forward_current_excitatory - forward_current_inhibitory
+                forward_contribution = torch.nn.functional.linear(
+                    forward_input, forward_weights)
 
             total_current += forward_contribution
 
             # backward
             if self.next_layer is not None:
-                excitatory_backward_mask = self.next_layer.excitatory_mask_vec
-
-                inhib_backward_masked = self.next_layer.inhibitory_mask_vec.unsqueeze(0).expand(
-                    self.layer_settings.size, -1) * self.backward_weights.weight()
-                excitatory_backward_masked = excitatory_backward_mask.unsqueeze(
-                    0).expand(self.layer_settings.size, -1) * self.backward_weights.weight()
-
-                assert inhib_backward_masked.shape == self.backward_weights.weight().shape
-                assert excitatory_backward_masked.shape == self.backward_weights.weight().shape
+                backward_weights = self.next_layer.synapse_sign_vec * self.backward_weights.weight()
+                assert backward_weights.shape == (
+                    self.layer_settings.size, self.layer_settings.next_size)
 
                 backward_input = self.next_layer.lif.spike_moving_average.spike_rec[-1]
-                backward_current_inhibitory = torch.nn.functional.linear(
-                    backward_input, inhib_backward_masked)
-                backward_current_excitatory = torch.nn.functional.linear(
-                    backward_input, excitatory_backward_masked)
-
-                backward_contribution = backward_current_excitatory - backward_current_inhibitory
+                backward_contribution = torch.nn.functional.linear(
+                    backward_input, backward_weights)
                 total_current += backward_contribution
 
         assert total_current.shape == (
@@ -307,7 +287,9 @@ class Layer(nn.Module):
             self.layer_settings.size)
 
         # forward pass
-        spk = self.lif.forward(total_current)
+        # NOTE: Under autocast the matmuls produce low precision currents, the
+        # neuron state is kept in float32. This is a no-op for float32 currents.
+        spk = self.lif.forward(total_current.float())
         self.forward_counter += 1
 
         return spk
@@ -317,9 +299,67 @@ class Layer(nn.Module):
                                spike: torch.Tensor, mem: torch.Tensor) -> None:
         pass
 
+    def __postsynaptic_terms(self) -> Tuple[torch.Tensor, torch.Tensor, Tuple[torch.Tensor, ...]]:
+        """
+        Computes the parts of the LPL excitatory learning rule that only depend
+        on the neurons of this layer: f'(U_i(t)) and the filtered second term.
+        They are the same for every projection into this layer, so they are
+        computed once per timestep and shared by the excitatory updates.
+
+        Also returns the unfiltered second term and its parts, which are only
+        needed to build the equation context for debug logging.
+        """
+        with torch.no_grad():
+            # f'(u_i) = beta / (1 + beta * |u_i - theta_rest|)^2, skipping the
+            # subtraction when theta_rest is 0 and squaring with a multiply
+            u_i = self.lif.mem()
+            if THETA_REST != 0:
+                u_i = u_i - THETA_REST
+            f_prime_denominator = 1 + ZENKE_BETA * u_i.abs()
+            f_prime_u_i = ZENKE_BETA / (f_prime_denominator * f_prime_denominator)
+            f_prime_u_i = f_prime_u_i.unsqueeze(2)
+
+            assert f_prime_u_i.shape == (
+                self.layer_settings.batch_size, self.layer_settings.size, 1)
+
+            # second term
+            current_layer_most_recent_spike = self.lif.spike_moving_average.spike_rec[
+                0]
+            current_layer_delta_t_spikes_ago = self.lif.spike_moving_average.spike_rec[-1]
+            current_layer_spike_moving_average = self.lif.spike_moving_average.tracked_value()
+            current_layer_variance_moving_average = self.lif.variance_moving_average.tracked_value()
+
+            second_term_prediction_error = current_layer_most_recent_spike - \
+                current_layer_delta_t_spikes_ago
+            second_term_deviation_scale = LAMBDA_HEBBIAN / \
+                (current_layer_variance_moving_average + XI)
+            second_term_deviation = current_layer_most_recent_spike - \
+                current_layer_spike_moving_average
+            second_term_no_filter = -1 * \
+                (second_term_prediction_error) + second_term_deviation_scale * \
+                second_term_deviation + DELTA
+            # the filter is elementwise and the second term is the same for
+            # every presynaptic neuron j, so filter before broadcasting along j
+            second_term_no_filter = second_term_no_filter.unsqueeze(2)
+            second_term_alpha = self.second_term_alpha_filter.apply(
+                second_term_no_filter, self.layer_settings.dt)
+
+            # assert shapes
+            assert second_term_deviation.shape == (
+                self.layer_settings.batch_size, self.layer_settings.size)
+            assert second_term_no_filter.shape == (self.layer_settings.batch_size,
+                                                   self.layer_settings.size, 1)
+            assert second_term_alpha.shape == (self.layer_settings.batch_size,
+                                               self.layer_settings.size, 1)
+
+        second_term_parts = (second_term_no_filter, second_term_prediction_error, second_term_deviation_scale,
+                             second_term_deviation)
+        return f_prime_u_i, second_term_alpha, second_term_parts
+
     def train_excitatory_from_layer(self, synaptic_update_type: SynapticUpdateType, spike: torch.Tensor,
                                     filter_group: ExcitatorySynapseFilterGroup, from_layer: Optional[Self],
-                                    data: torch.Tensor) -> None:
+                                    data: torch.Tensor, f_prime_u_i: torch.Tensor, second_term_alpha: torch.Tensor,
+                                    second_term_parts: Tuple[torch.Tensor, ...]) -> None:
         """
         The LPL excitatory learning rule is implemented here. It is defined as dw_ji/dt,
         for which we optimize the computation with matrices.
@@ -328,11 +368,11 @@ class Layer(nn.Module):
 
          1. The first term contains S_j(t) * f'(U_i(t)). We form a matrix via
             some unsqueezes to form a first term matrix of size (batch_size, i,
-            j). This is performed with outer product.
+            j). This is performed with a broadcast outer product.
 
-         2. The second term contains S_i. We form a matrix via some unsqueezes
-            to form a second term matrix of size (batch_size, i, j). This is
-            performed by expanding and copying the tensor along the j dimension.
+         2. The second term contains S_i. It is a matrix of size (batch_size,
+            i, 1) that does not depend on j, so it is passed in precomputed
+            along with f'(U_i(t)) and broadcast along the j dimension.
 
         The final dw_ij/dt is formed by a Hadamard product of the first term and
         the second term. This is then summed across the batch dimension and
@@ -346,30 +386,27 @@ class Layer(nn.Module):
         from_layer_size = from_layer.layer_settings.size if from_layer is not None else self.layer_settings.data_size
 
         if from_layer is not None:
-            # flip the mask as this is for excitatory connections
-            mask = (~from_layer.inhibitory_mask_vec.bool()).int()
-            # expand the mask across the synaptic weight matrix
-            mask = mask.unsqueeze(0).expand(self.layer_settings.size, -1)
-            assert mask.shape == (self.layer_settings.size, from_layer_size)
+            # the excitatory mask is the flipped inhibitory mask and is built once
+            # when the layer is constructed
+            mask = from_layer.excitatory_mask_vec
+            # the mask broadcasts across the rows of the synaptic weight matrix
+            assert mask.shape == (from_layer_size,)
 
         with torch.no_grad():
             # first term
-            f_prime_u_i = ZENKE_BETA * \
-                (1 + ZENKE_BETA * abs(self.lif.mem() - THETA_REST)) ** (-2)
-            f_prime_u_i = f_prime_u_i.unsqueeze(2)
             from_layer_most_recent_spike: torch.Tensor = from_layer.lif.spike_moving_average.spike_rec[
                 0] if from_layer is not None else data  # type: ignore [union-attr, assignment]
             from_layer_most_recent_spike = from_layer_most_recent_spike.unsqueeze(
                 1)
-            first_term_no_filter = f_prime_u_i @ from_layer_most_recent_spike
+            # (batch_size, i, 1) * (batch_size, 1, j) is an elementwise outer
+            # product, cheaper than a batched matmul with an inner dim of 1
+            first_term_no_filter = f_prime_u_i * from_layer_most_recent_spike
             first_term_epsilon = filter_group.first_term_epsilon.apply(
                 first_term_no_filter, self.layer_settings.dt)
             first_term_alpha = filter_group.first_term_alpha.apply(
                 first_term_epsilon, self.layer_settings.dt)
 
             # assert shapes
-            assert f_prime_u_i.shape == (
-                self.layer_settings.batch_size, self.layer_settings.size, 1)
             assert from_layer_most_recent_spike.shape == (
                 self.layer_settings.batch_size, 1, from_layer_size)
             assert first_term_no_filter.shape == (self.layer_settings.batch_size,
@@ -379,41 +416,10 @@ class Layer(nn.Module):
             assert first_term_alpha.shape == (self.layer_settings.batch_size,
                                               self.layer_settings.size, from_layer_size)
 
-            # second term
-            current_layer_most_recent_spike = self.lif.spike_moving_average.spike_rec[
-                0]
-            current_layer_delta_t_spikes_ago = self.lif.spike_moving_average.spike_rec[-1]
-            current_layer_spike_moving_average = self.lif.spike_moving_average.tracked_value()
-            current_layer_variance_moving_average = self.lif.variance_moving_average.tracked_value()
-
-            second_term_prediction_error = current_layer_most_recent_spike - \
-                current_layer_delta_t_spikes_ago
-            second_term_deviation_scale = LAMBDA_HEBBIAN / \
-                (current_layer_variance_moving_average + XI)
-            second_term_deviation = current_layer_most_recent_spike - \
-                current_layer_spike_moving_average
-            second_term_no_filter = -1 * \
-                (second_term_prediction_error) + second_term_deviation_scale * \
-                second_term_deviation + DELTA
-            # this can potentially be done after the filter
-            second_term_no_filter = second_term_no_filter.unsqueeze(
-                2).expand(-1, -1, from_layer_size)
-            second_term_alpha = filter_group.second_term_alpha.apply(
-                second_term_no_filter, self.layer_settings.dt)
-
-            # assert shapes
-            assert second_term_deviation.shape == (
-                self.layer_settings.batch_size, self.layer_settings.size)
-            assert second_term_no_filter.shape == (self.layer_settings.batch_size,
-                                                   self.layer_settings.size, from_layer_size)
-            assert second_term_alpha.shape == (self.layer_settings.batch_size,
-                                               self.layer_settings.size, from_layer_size)
-
             # update weights
+            # average across the batch dimension
             dw_dt = self.layer_settings.learning_rate * (first_term_alpha *
-                                                         second_term_alpha)
-
-            dw_dt = dw_dt.sum(0) / dw_dt.shape[0]
+                                                         second_term_alpha).mean(0)
             if from_layer is not None:
                 dw_dt = dw_dt * mask
 
@@ -427,13 +433,14 @@ class Layer(nn.Module):
                 case _:
                     raise ValueError("Invalid synaptic update type")
 
-            weight_ref.linear.weight += dw_dt
-            clamped_weights = torch.clamp(weight_ref.linear.weight, min=0)
-            weight_ref.linear.weight = torch.nn.Parameter(clamped_weights)
+            # update and clamp in place rather than allocating a new Parameter
+            weight_ref.linear.weight.add_(dw_dt).clamp_(min=0)
 
-            # only log for first layer and forward connections
+            # only log for first layer and forward connections, and only build
+            # the equation context when it would actually be logged
             # TODO: remove or refactor when learning rule is stable
-            if self.prev_layer is None and synaptic_update_type == SynapticUpdateType.FORWARD:
+            if self.prev_layer is None and synaptic_update_type == SynapticUpdateType.FORWARD and \
+                    logging.getLogger().isEnabledFor(logging.DEBUG):
                 first_term = ExcitatorySynapticWeightEquation.FirstTerm(
                     alpha_filter=first_term_alpha,
                     epsilon_filter=first_term_epsilon,
@@ -441,6 +448,8 @@ class Layer(nn.Module):
                     f_prime_u_i=f_prime_u_i,
                     from_layer_most_recent_spike=from_layer_most_recent_spike
                 )
+                second_term_no_filter, second_term_prediction_error, second_term_deviation_scale, \
+                    second_term_deviation = second_term_parts
                 second_term = ExcitatorySynapticWeightEquation.SecondTerm(
                     alpha_filter=second_term_alpha,
                     no_filter=second_term_no_filter,
@@ -461,21 +470,23 @@ class Layer(nn.Module):
 
     def train_inhibitory_from_layer(self, synaptic_update_type: SynapticUpdateType, spike: torch.Tensor,
                                     from_layer: Self) -> None:
-        # expand the mask across the synaptic weight matrix
-        mask = from_layer.inhibitory_mask_vec.unsqueeze(
-            0).expand(self.layer_settings.size, -1)
-        assert mask.shape == (
-            self.layer_settings.size,
-            from_layer.layer_settings.size)
+        # the mask broadcasts across the rows of the synaptic weight matrix
+        mask = from_layer.inhibitory_mask_vec
+        assert mask.shape == (from_layer.layer_settings.size,)
 
         self.inhibitory_trace.apply(spike, self.layer_settings.dt)
 
         with torch.no_grad():
-            x_i = self.inhibitory_trace.tracked_value().unsqueeze(
-                2).expand(-1, -1, from_layer.layer_settings.size)
-            S_j = from_layer.lif.spike_moving_average.spike_rec[-1].unsqueeze(
-                1).expand(-1, self.layer_settings.size, -1)
-            assert x_i.shape == S_j.shape
+            # (batch_size, i, 1) and (batch_size, 1, j) broadcast to (batch_size, i, j)
+            x_i = self.inhibitory_trace.tracked_value().unsqueeze(2)
+            S_j = from_layer.lif.spike_moving_average.spike_rec[-1].unsqueeze(1)
+            S_i = self.lif.spike_moving_average.spike_rec[-1].unsqueeze(2)
+
+            # NOTE: With neither side spiking both terms, and so the update, are
+            # exactly zero. The check forces a device sync, so it is only done
+            # on the CPU.
+            if S_j.device.type == "cpu" and not (S_j.any() or S_i.any()):
+                return
 
             # x_i * S_j
             first_term = (x_i - 2 * KAPPA *
@@ -484,18 +495,15 @@ class Layer(nn.Module):
                                         self.layer_settings.size, from_layer.layer_settings.size)
 
             # S_i * x_j
-            S_i = self.lif.spike_moving_average.spike_rec[-1].unsqueeze(
-                2).expand(-1, -1, from_layer.layer_settings.size)
-            x_j = from_layer.inhibitory_trace.tracked_value().unsqueeze(1).expand(
-                -1, self.layer_settings.size, -1)
+            x_j = from_layer.inhibitory_trace.tracked_value().unsqueeze(1)
 
             second_term = S_i * x_j
             assert second_term.shape == (self.layer_settings.batch_size,
                                          self.layer_settings.size, from_layer.layer_settings.size)
 
+            # average across the batch dimension
             dw_dt = self.layer_settings.learning_rate * \
-                (first_term + second_term)
-            dw_dt = dw_dt.sum(0) / dw_dt.shape[0]
+                (first_term + second_term).mean(0)
 
             # update weights and apply mask
             dw_dt = dw_dt * mask
@@ -511,30 +519,36 @@ class Layer(nn.Module):
                 case _:
                     raise ValueError("Invalid synaptic update type")
 
-            weight_ref.linear.weight += dw_dt
-            clamped_weights = torch.clamp(weight_ref.linear.weight, min=0)
-            weight_ref.linear.weight = torch.nn.Parameter(clamped_weights)
+            # update and clamp in place rather than allocating a new Parameter
+            weight_ref.linear.weight.add_(dw_dt).clamp_(min=0)
 
     def train_synapses(self, spike: torch.Tensor, data: torch.Tensor) -> None:
+        f_prime_u_i, second_term_alpha, second_term_parts = self.__postsynaptic_terms()
+
         # recurrent connections always trained
         self.train_excitatory_from_layer(
             SynapticUpdateType.RECURRENT,
             spike,
             self.recurrent_filter_group,
             self,
-            data)
+            data,
+            f_prime_u_i,
+            second_term_alpha,
+            second_term_parts)
         self.train_inhibitory_from_layer(
             SynapticUpdateType.RECURRENT, spike, self)
 
         if self.next_layer is not None:
             self.train_excitatory_from_layer(
-                SynapticUpdateType.BACKWARD, spike, self.backward_filter_group, self.next_layer, data)
+                SynapticUpdateType.BACKWARD, spike, self.backward_filter_group, self.next_layer, data,
+                f_prime_u_i, second_term_alpha, second_term_parts)
             self.train_inhibitory_from_layer(
                 SynapticUpdateType.BACKWARD, spike, self.next_layer)
 
         # if prev layer is None then forward connections driven by data
         self.train_excitatory_from_layer(SynapticUpdateType.FORWARD, spike,
-                                         self.forward_filter_group, self.prev_layer, data)
+                                         self.forward_filter_group, self.prev_layer, data,
+                                         f_prime_u_i, second_term_alpha, second_term_parts)
 
         # no forward connections from data are treated as inhibitory
         if self.prev_layer is not None:
@@ -7,8 +7,7 @@ import torch.nn as nn
 class SpikeOperator():
     @staticmethod
     def forward(mem: torch.Tensor, threshold: torch.Tensor) -> torch.Tensor:
-        spk = torch.where(mem > threshold, torch.as_tensor(1.0, device=mem.device),
-                          torch.as_tensor(0.0, device=mem.device))
+        spk = (mem > threshold).to(mem.dtype)
         return spk
 
 
@@ -54,15 +53,14 @@ class LIF(nn.Module):
             self.adaptive_threshold = torch.full_like(current, self.threshold)
 
         # Update membrane potential: decay and add current
-        self.mem = self.beta * self.mem + current
-        self.prereset_mem = self.mem.clone()
+        self.prereset_mem = self.beta * self.mem + current
 
         # Spike if membrane potential exceeds adaptive threshold
-        spk: torch.Tensor = self.spike_op(self.mem, self.adaptive_threshold)
+        spk: torch.Tensor = self.spike_op(self.prereset_mem, self.adaptive_threshold)
 
-        # Reset the membrane potential if spiked
-        reset = spk * self.adaptive_threshold
-        self.mem -= reset
+        # Reset the membrane potential if spiked. This writes a new tensor, so
+        # `prereset_mem` is kept without a copy.
+        self.mem = torch.addcmul(self.prereset_mem, spk, self.adaptive_threshold, value=-1)
 
         # Update adaptive threshold
         self.adaptive_threshold = torch.where(spk.bool(), self.adaptive_threshold * self.threshold_scale,
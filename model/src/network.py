@@ -1,5 +1,6 @@
+import contextlib
 import logging
-from typing import List
+from typing import Any, ContextManager, List, Tuple, cast
 
 from torch import nn
 import torch
@@ -24,29 +25,7 @@ class Net(nn.Module):
             next_size = settings.layer_sizes[i + 1] if i < len(
                 settings.layer_sizes) - 1 else 0
             layer_id = i
-            layer_settings = LayerSettings(layer_id,
-                                           prev_size,
-                                           size,
-                                           next_size,
-                                           settings.batch_size,
-                                           settings.learning_rate,
-                                           settings.data_size,
-                                           settings.dt,
-                                           settings.percentage_inhibitory,
-                                           settings.exc_to_inhib_conn_c,
-                                           settings.exc_to_inhib_conn_sigma_squared,
-                                           settings.layer_sparsity,
-                                           settings.decay_beta,
-                                           settings.threshold_scale,
-                                           settings.threshold_decay,
-                                           settings.tau_mean,
-                                           settings.tau_var,
-                                           settings.tau_stdp,
-                                           settings.tau_rise_alpha,
-                                           settings.tau_fall_alpha,
-                                           settings.tau_rise_epsilon,
-                                           settings.tau_fall_epsilon,
-                                           settings.device)
+            layer_settings = LayerSettings(layer_id, prev_size, size, next_size, settings)
             network_layer_settings.append(layer_settings)
 
         # make layers
@@ -54,6 +33,10 @@ class Net(nn.Module):
         for i, layer_spec in enumerate(network_layer_settings):
             layer = Layer(layer_spec)
             self.layers.append(layer)
+        # NOTE: Iterating a ModuleList goes through its module dict, so the
+        # timestep loop iterates this tuple instead
+        self._layers_tuple: Tuple[Layer, ...] = tuple(cast(Layer, layer) for layer in self.layers)
+        self._later_layers = self._layers_tuple[1:]
 
         # connect layers
         for i, layer in enumerate(self.layers):
@@ -67,42 +50,64 @@ class Net(nn.Module):
             layer.set_sparsity_masks()
 
     def layer_activations(self) -> List[torch.Tensor]:
-        return [layer.retreive_activations() for layer in self.layers]
+        # copy all layers out of their spike buffers at once, the returned
+        # tensors are views into that copy
+        activations = torch.cat([layer.retreive_activations() for layer in self._layers_tuple], dim=1)
+        return list(activations.split(self.settings.layer_sizes, dim=1))
+
+    def _run_one_timestep(self, data: torch.Tensor) -> None:
+        # only the first layer is driven by the data
+        first_layer = self._layers_tuple[0]
+        spk = first_layer.forward(data)
+        first_layer.train_synapses(spk, data)
+
+        for layer in self._later_layers:
+            spk = layer.forward()
+            layer.train_synapses(spk, data)
 
-    def process_data_single_timestep(self, data: torch.Tensor) -> None:
-        data = data.to(self.settings.device)
+    def _autocast(self) -> ContextManager[Any]:
+        # NOTE: Without an amp dtype this must not enter a disabled autocast,
+        # which would turn off any autocast the caller has enabled
+        if self.settings.amp_dtype is None:
+            return contextlib.nullcontext()
 
-        for i, layer in enumerate(self.layers):
-            if i == 0:
-                spk = layer.forward(data)
-            else:
-                spk = layer.forward()
+        return torch.autocast(device_type=self.settings.device.type, dtype=self.settings.amp_dtype)
 
-            layer.train_synapses(spk, data)
+    def process_data_single_timestep(self, data: torch.Tensor) -> None:
+        data = data.to(self.settings.device)
+        with self._autocast():
+            self._run_one_timestep(data)
 
     # TODO: handle test data
     def process_data_online(self, train_loader: DataLoader) -> None:
+        batches_processed = 0
         for epoch in range(self.settings.epochs):
-            for i, batch in enumerate(train_loader):
-                batch = batch.to(self.settings.device)
-
-                # permute to (num_steps, batch_size, data_size)
-                batch = batch.permute(1, 0, 2)
-
-                if self.settings.encode_spike_trains:
-                    batch = (batch > 0.5).float()
+            for i, batch in enumerate(tqdm(train_loader, desc=f"Epoch {epoch} batches")):
+                # spike trains are encoded by SpikeEncodedDataset in the loader
+                # workers, which yields uint8 batches
+                if self.settings.encode_spike_trains and batch.dtype != torch.uint8:
+                    raise ValueError(
+                        "encode_spike_trains is set but the batches are not spike encoded, wrap the dataset in "
+                        "SpikeEncodedDataset")
+
+                # NOTE: Only overlaps with compute when the loader uses
+                # `pin_memory=True`, otherwise this is a regular blocking copy.
+                batch = batch.to(self.settings.device, non_blocking=True)
+
+                # permute to (num_steps, batch_size, data_size) and make it
+                # contiguous once per batch so that every timestep slice is
+                # contiguous. Spike encoded batches arrive as uint8, they are
+                # made contiguous as bytes and then cast, which keeps the strides.
+                batch = batch.permute(1, 0, 2).contiguous().to(torch.get_default_dtype())
 
                 logging.info(
                     f"Epoch {epoch} - Batch {i} - Sample data: {batch.shape}")
 
-                for timestep in tqdm(range(batch.shape[0]), desc="Timesteps"):
-                    for i, layer in enumerate(self.layers):
-                        if i == 0:
-                            spk = layer.forward(batch[timestep])
-                        else:
-                            spk = layer.forward()
-
-                        layer.train_synapses(spk, batch[timestep])
+                # NOTE: No progress bar here, this is the hottest loop
+                with self._autocast():
+                    for timestep_data in batch.unbind(0):
+                        self._run_one_timestep(timestep_data)
 
-                # TODO: remove when network is stabilized
-                return
+                batches_processed += 1
+                if self.settings.max_batches is not None and batches_processed >= self.settings.max_batches:
+                    return
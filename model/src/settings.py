@@ -1,3 +1,5 @@
+from typing import Optional
+
 import torch
 
 from model.src.constants import DECAY_BETA, DT, EXC_TO_INHIB_CONN_C, EXC_TO_INHIB_CONN_SIGMA_SQUARED, \
@@ -28,12 +30,16 @@ class Settings:
                  tau_fall_alpha: float = TAU_FALL_ALPHA,
                  tau_rise_epsilon: float = TAU_RISE_EPSILON,
                  tau_fall_epsilon: float = TAU_FALL_EPSILON,
-                 device: torch.device = torch.device("cpu")) -> None:
+                 device: torch.device = torch.device("cpu"),
+                 amp_dtype: Optional[torch.dtype] = None,
+                 max_batches: Optional[int] = None) -> None:
         self.layer_sizes = layer_sizes
         self.data_size = data_size
         self.batch_size = batch_size
         self.learning_rate = learning_rate
         self.epochs = epochs
+        # NOTE: The encoding itself is done by wrapping the dataset in
+        # `SpikeEncodedDataset`. The network only checks that it was.
         self.encode_spike_trains = encode_spike_trains
         self.dt = dt
         self.percentage_inhibitory = percentage_inhibitory
@@ -51,6 +57,12 @@ class Settings:
         self.tau_rise_epsilon = tau_rise_epsilon
         self.tau_fall_epsilon = tau_fall_epsilon
         self.device = device
+        # NOTE: When set, the synaptic matmuls run under autocast in this dtype.
+        # Weights, neuron state and the learning rule stay in float32.
+        self.amp_dtype = amp_dtype
+        # NOTE: Stops online processing after this many batches in total, across
+        # epochs. None processes every batch of every epoch.
+        self.max_batches = max_batches
 
 
 class LayerSettings:
@@ -59,45 +71,29 @@ class LayerSettings:
                  prev_size: int,
                  size: int,
                  next_size: int,
-                 batch_size: int,
-                 learning_rate: float,
-                 data_size: int,
-                 dt: float,
-                 percentage_inhibitory: int,
-                 exc_to_inhib_conn_c: float,
-                 exc_to_inhib_conn_sigma_squared: float,
-                 layer_sparsity: float,
-                 decay_beta: float,
-                 threshold_scale: float,
-                 threshold_decay: float,
-                 tau_mean: float,
-                 tau_var: float,
-                 tau_stdp: float,
-                 tau_rise_alpha: float,
-                 tau_fall_alpha: float,
-                 tau_rise_epsilon: float,
-                 tau_fall_epsilon: float,
-                 device: torch.device) -> None:
+                 settings: Settings) -> None:
+        # NOTE: The network wide values are copied into plain attributes rather
+        # than looked up on `settings`, since they are read every timestep.
         self.layer_id = layer_id
         self.prev_size = prev_size
         self.size = size
         self.next_size = next_size
-        self.batch_size = batch_size
-        self.learning_rate = learning_rate
-        self.data_size = data_size
-        self.dt = dt
-        self.percentage_inhibitory = percentage_inhibitory
-        self.exc_to_inhib_conn_c = exc_to_inhib_conn_c
-        self.exc_to_inhib_conn_sigma_squared = exc_to_inhib_conn_sigma_squared
-        self.layer_sparsity = layer_sparsity
-        self.decay_beta = decay_beta
-        self.threshold_scale = threshold_scale
-        self.threshold_decay = threshold_decay
-        self.tau_mean = tau_mean
-        self.tau_var = tau_var
-        self.tau_stdp = tau_stdp
-        self.tau_rise_alpha = tau_rise_alpha
-        self.tau_fall_alpha = tau_fall_alpha
-        self.tau_rise_epsilon = tau_rise_epsilon
-        self.tau_fall_epsilon = tau_fall_epsilon
-        self.device = device
+        self.batch_size = settings.batch_size
+        self.learning_rate = settings.learning_rate
+        self.data_size = settings.data_size
+        self.dt = settings.dt
+        self.percentage_inhibitory = settings.percentage_inhibitory
+        self.exc_to_inhib_conn_c = settings.exc_to_inhib_conn_c
+        self.exc_to_inhib_conn_sigma_squared = settings.exc_to_inhib_conn_sigma_squared
+        self.layer_sparsity = settings.layer_sparsity
+        self.decay_beta = settings.decay_beta
+        self.threshold_scale = settings.threshold_scale
+        self.threshold_decay = settings.threshold_decay
+        self.tau_mean = settings.tau_mean
+        self.tau_var = settings.tau_var
+        self.tau_stdp = settings.tau_stdp
+        self.tau_rise_alpha = settings.tau_rise_alpha
+        self.tau_fall_alpha = settings.tau_fall_alpha
+        self.tau_rise_epsilon = settings.tau_rise_epsilon
+        self.tau_fall_epsilon = settings.tau_fall_epsilon
+        self.device = settings.device
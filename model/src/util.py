@@ -1,7 +1,6 @@
 from enum import Enum
 import math
-from collections import deque
-from typing import Deque, Optional, Tuple
+from typing import Iterator, Optional, Tuple
 
 import torch
 
@@ -102,14 +101,17 @@ class DoubleExponentialFilter:
             # Initialize fall based on the first error received
             self.fall = torch.zeros_like(value).to(self.device)
 
+        # NOTE: The state is updated in place to avoid allocating new state
+        # tensors every timestep. The returned tensor is the state itself.
+        #
         # Apply the exponential decay to the rise state and add the error
         decay_factor_rise = math.exp(-dt / self.tau_rise)
-        self.rise = self.rise * decay_factor_rise + value
+        self.rise.mul_(decay_factor_rise).add_(value)
 
         # Apply the exponential decay to the fall state and add the rise state
         decay_factor_fall = math.exp(-dt / self.tau_fall)
-        self.fall = self.fall * decay_factor_fall + \
-            (1 - decay_factor_fall) * self.rise
+        self.fall.mul_(decay_factor_fall).add_(
+            (1 - decay_factor_fall) * self.rise)
 
         return self.fall
 
@@ -122,8 +124,42 @@ class ExcitatorySynapseFilterGroup:
             layer_settings.tau_rise_alpha, layer_settings.tau_fall_alpha, device=layer_settings.device)
         self.first_term_epsilon = DoubleExponentialFilter(
             layer_settings.tau_rise_epsilon, layer_settings.tau_fall_epsilon, device=layer_settings.device)
-        self.second_term_alpha = DoubleExponentialFilter(
-            layer_settings.tau_rise_alpha, layer_settings.tau_fall_alpha, device=layer_settings.device)
+
+
+class SpikeRingBuffer:
+
+    def __init__(self, capacity: int, batch_size: int, data_size: int,
+                 device: torch.device) -> None:
+        """
+        A fixed size history of spikes, stored in one preallocated tensor of
+        shape (capacity, batch_size, data_size) that is written in a circle.
+
+        Indexing follows `collections.deque`: index 0 is the oldest retained
+        spike and index -1 is the most recent one. Indexing returns a view into
+        the buffer, which is overwritten `capacity` appends later.
+        """
+        self.capacity = capacity
+        self.buffer = torch.zeros(capacity, batch_size, data_size, device=device)
+        # position of the oldest spike, which is also the next one overwritten
+        self.index = 0
+
+    def append(self, spike: torch.Tensor) -> None:
+        self.buffer[self.index] = spike
+        self.index = (self.index + 1) % self.capacity
+
+    def __getitem__(self, i: int) -> torch.Tensor:
+        if not -self.capacity <= i < self.capacity:
+            raise IndexError("SpikeRingBuffer index out of range")
+
+        return self.buffer[(self.index + i) % self.capacity]
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        # oldest to most recent, like a deque
+        for i in range(self.capacity):
+            yield self[i]
+
+    def __len__(self) -> int:
+        return self.capacity
 
 
 class SpikeMovingAverage:
@@ -146,10 +182,8 @@ class SpikeMovingAverage:
         self.device = device
         self.mean: Optional[torch.Tensor] = None
         self.tau_mean = tau_mean
-        self.spike_rec: Deque[torch.Tensor] = deque(maxlen=MAX_RETAINED_SPIKES)
-        for _ in range(MAX_RETAINED_SPIKES):
-            self.spike_rec.append(torch.zeros(
-                batch_size, data_size).to(device=device))
+        self.spike_rec = SpikeRingBuffer(
+            MAX_RETAINED_SPIKES, batch_size, data_size, device=device)
 
     def apply(self, spike: torch.Tensor, dt: float = DT) -> torch.Tensor:
         self.spike_rec.append(spike)
@@ -161,7 +195,7 @@ class SpikeMovingAverage:
         # Apply the exponential decay to the mean state and add the new spike
         # value
         decay_factor = math.exp(-dt / self.tau_mean)
-        self.mean = self.mean * decay_factor + (1 - decay_factor) * spike
+        self.mean.mul_(decay_factor).add_((1 - decay_factor) * spike)
 
         return self.mean
 
@@ -201,8 +235,8 @@ class VarianceMovingAverage:
         # Apply the exponential decay to the variance state and add the squared
         # deviation
         decay_factor = math.exp(-dt / self.tau_var)
-        self.variance = self.variance * decay_factor + \
-            (1 - decay_factor) * (spike - spike_moving_average) ** 2
+        self.variance.mul_(decay_factor).add_(
+            (1 - decay_factor) * (spike - spike_moving_average) ** 2)
 
         assert self.variance is not None
         return self.variance
@@ -230,7 +264,7 @@ class InhibitoryPlasticityTrace:
 
     def apply(self, spike: torch.Tensor, dt: float = DT) -> torch.Tensor:
         decay_factor = math.exp(-dt / self.tau_stdp)
-        self.trace = self.trace * decay_factor + spike
+        self.trace.mul_(decay_factor).add_(spike)
 
         return self.trace
 
@@ -5,7 +5,7 @@ from torch.utils.data import DataLoader
 
 from benchmarks.src.pointcloud import ENCODE_SPIKE_TRAINS
 from datasets.src.zenke_2a.constants import TRAIN_DATA_PATH
-from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset
+from datasets.src.zenke_2a.dataset import DatasetType, SequentialDataset, SpikeEncodedDataset
 from model.src.layer import Layer
 from model.src.logging_util import set_logging
 from model.src.network import Net
@@ -43,7 +43,9 @@ if __name__ == "__main__":
         tau_fall_alpha=.05,
         tau_rise_epsilon=0.002,
         tau_fall_epsilon=0.02,
-        device=torch.device("cpu")
+        device=torch.device("cpu"),
+        # TODO: remove when network is stabilized
+        max_batches=1
     )
 
     wandb.init(
@@ -59,14 +61,16 @@ if __name__ == "__main__":
     )
 
     try:
-        train_dataframe = pd.read_csv(TRAIN_DATA_PATH)
+        train_dataframe = pd.read_csv(TRAIN_DATA_PATH, engine="pyarrow")
     except FileNotFoundError:
         train_dataframe = None
     train_sequential_dataset = SequentialDataset(DatasetType.TRAIN,
                                                  train_dataframe, num_timesteps=THIS_TEST_NUM_DATAPOINTS,
                                                  planned_batch_size=settings.batch_size)
+    train_dataset = SpikeEncodedDataset(
+        train_sequential_dataset) if settings.encode_spike_trains else train_sequential_dataset
     train_data_loader = DataLoader(
-        train_sequential_dataset, batch_size=settings.batch_size, shuffle=False)
+        train_dataset, batch_size=settings.batch_size, shuffle=False)
 
     net = Net(settings).to(settings.device)
 
@@ -78,16 +82,14 @@ if __name__ == "__main__":
     # weights for that neuron.
     layer: Layer = net.layers[0]
     weights = layer.forward_weights.weight()
-    mask = layer.excitatory_mask_vec
-    mask_expanded = mask.unsqueeze(
-        1).expand(-1, layer.layer_settings.data_size)
+    excitatory_rows = layer.excitatory_mask_vec.bool()
     # This will eliminate all weights that are not connecting to an excitatory
-    # neuron, then collapse the dim down to 1. Since the original data is of
+    # neuron, then flatten the rows down to 1 dim. Since the original data is of
     # size 2, the weights from x and y will be batched into segments of 2 from
     # this 1d vector. For our purposes we can simply take the first index,
     # representing the weight connecting the x datapoint to the first excitatory
     # neuron.
-    starting_weights_filtered_and_masked = weights[mask_expanded.bool()]
+    starting_weights_filtered_and_masked = weights[excitatory_rows].flatten()
 
     # TODO: figure out if we can fix this test
     # assert starting_weights_filtered_and_masked[0] > 0.1
@@ -96,7 +98,7 @@ if __name__ == "__main__":
     net.process_data_online(train_data_loader)
 
     weights = layer.forward_weights.weight()
-    weights_filtered_and_masked = weights[mask_expanded.bool()]
+    weights_filtered_and_masked = weights[excitatory_rows].flatten()
     print(starting_weights_filtered_and_masked)
     print(weights_filtered_and_masked)
 
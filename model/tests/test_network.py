@@ -0,0 +1,67 @@
+from typing import List, Optional
+
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from model.src.network import Net
+from model.src.settings import Settings
+
+
+def make_settings(amp_dtype: Optional[torch.dtype] = None, epochs: int = 1, max_batches: Optional[int] = None,
+                  encode_spike_trains: bool = False) -> Settings:
+    return Settings(
+        layer_sizes=[4, 6],
+        data_size=2,
+        batch_size=3,
+        learning_rate=0.01,
+        epochs=epochs,
+        encode_spike_trains=encode_spike_trains,
+        device=torch.device("cpu"),
+        amp_dtype=amp_dtype,
+        max_batches=max_batches)
+
+
+def make_loader(data: torch.Tensor) -> DataLoader:
+    # collate back into a plain (batch_size, num_timesteps, data_size) tensor,
+    # which is what process_data_online expects from the loader
+    return DataLoader(TensorDataset(data), batch_size=3, shuffle=False,
+                      collate_fn=lambda samples: torch.stack([sample[0] for sample in samples]))
+
+
+def test_autocast_keeps_weights_and_state_float32() -> None:
+    torch.manual_seed(1234)
+    net = Net(make_settings(amp_dtype=torch.bfloat16))
+
+    for _ in range(5):
+        net.process_data_single_timestep(torch.rand(3, 2))
+
+    for layer in net._layers_tuple:
+        assert layer.recurrent_weights.linear.weight.dtype == torch.float32
+        assert layer.forward_weights.linear.weight.dtype == torch.float32
+        assert layer.lif.neuron_layer.mem.dtype == torch.float32
+        assert layer.lif.neuron_layer.prereset_mem.dtype == torch.float32
+        assert layer.retreive_activations().dtype == torch.float32
+
+
+@pytest.mark.parametrize("max_batches, expected_batches", [(1, 1), (3, 3), (None, 6)])
+def test_process_data_online_stops_after_max_batches(max_batches: Optional[int], expected_batches: int,
+                                                     monkeypatch: pytest.MonkeyPatch) -> None:
+    num_timesteps = 4
+    # 2 batches per epoch over 3 epochs, so 3 batches spans two epochs
+    train_loader = make_loader(torch.rand(6, num_timesteps, 2))
+    net = Net(make_settings(epochs=3, max_batches=max_batches))
+
+    steps: List[torch.Tensor] = []
+    monkeypatch.setattr(net, "_run_one_timestep", steps.append)
+    net.process_data_online(train_loader)
+
+    assert len(steps) == expected_batches * num_timesteps
+
+
+def test_process_data_online_rejects_unencoded_batches() -> None:
+    train_loader = make_loader(torch.rand(3, 4, 2))
+    net = Net(make_settings(encode_spike_trains=True))
+
+    with pytest.raises(ValueError):
+        net.process_data_online(train_loader)
@@ -2,7 +2,8 @@ from typing import Tuple
 import pytest
 import torch
 
-from model.src.util import InhibitoryPlasticityTrace, SpikeMovingAverage, DoubleExponentialFilter, VarianceMovingAverage
+from model.src.util import InhibitoryPlasticityTrace, SpikeMovingAverage, SpikeRingBuffer, DoubleExponentialFilter, \
+    VarianceMovingAverage
 
 # TODO: consider testing with real tau constants and dt values
 
@@ -24,6 +25,29 @@ def test_temporal_filter() -> None:
     ) == pytest.approx(0.7217329740524292)
 
 
+def test_spike_ring_buffer() -> None:
+    buffer = SpikeRingBuffer(capacity=3, batch_size=1, data_size=1, device=device)
+
+    # Starts out filled with zeros
+    assert len(buffer) == 3
+    assert buffer[0].item() == 0
+    assert buffer[-1].item() == 0
+
+    # Indexing follows a deque: 0 is the oldest spike and -1 the most recent
+    for spike in [1, 2, 3, 4]:
+        buffer.append(torch.Tensor([[spike]]))
+    assert buffer[0].item() == 2
+    assert buffer[1].item() == 3
+    assert buffer[-1].item() == 4
+
+    # Out of range indices raise like a deque, so iteration terminates
+    with pytest.raises(IndexError):
+        buffer[3]
+    with pytest.raises(IndexError):
+        buffer[-4]
+    assert [spike.item() for spike in buffer] == [2, 3, 4]
+
+
 def test_spike_moving_average() -> None:
     sma = SpikeMovingAverage(
         device=device,